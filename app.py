@@ -1,28 +1,73 @@
 """
 AI 財務助手 - Flask 主應用程式
 """
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, make_response, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 from flask_apscheduler import APScheduler
+from flask_caching import Cache
 from datetime import datetime
-import json
+from functools import wraps
+import hashlib
+import numpy as np
+import orjson
 
 from config import Config
-from models.portfolio import get_db, Portfolio, Watchlist, TransactionLog
+from models.portfolio import get_db, get_portfolio, get_watchlist, get_transaction_log, get_symbol_metadata
 from services.stock_service import StockService
 from services.analysis_service import AnalysisService
 from services.ai_advisor import AIAdvisor
 from services.scheduler_service import SchedulerService
+from services.cache import cache_stats
 from services.risk_service import RiskAnalysisService
 
 
+class OrjsonProvider(DefaultJSONProvider):
+    """以 orjson 序列化 JSON（原生支援 NumPy 數值）"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC,
+        ).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # 初始化 Flask 應用
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = OrjsonProvider(app)
 
 # 初始化排程器
 scheduler = APScheduler()
 scheduler.init_app(app)
 
+# 初始化頁面快取
+cache = Cache(app)
+
+DASHBOARD_CACHE_KEY = 'dashboard'
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    """請求或排程任務結束時歸還資料庫連線"""
+    get_db().release()
+
+
+def conditional_json(view):
+    """為 JSON 回應加上 ETag，內容未變時回應 304 Not Modified"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            etag = hashlib.blake2b(response.get_data(), digest_size=8).hexdigest()
+            response.set_etag(etag, weak=True)
+            response = response.make_conditional(request)
+        return response
+    return wrapper
+
 
 # ==================== 排程任務 ====================
 
@@ -34,57 +79,79 @@ def scheduled_daily_report():
         SchedulerService.generate_daily_report()
 
 
+@scheduler.task('cron', id='refresh_symbol_metadata', hour=3, minute=0)
+def scheduled_refresh_symbol_metadata():
+    """每日 03:00 更新股票名稱、幣別"""
+    with app.app_context():
+        SchedulerService.refresh_symbol_metadata()
+
+
+@scheduler.task('interval', id='refresh_quotes', seconds=Config.QUOTE_REFRESH_INTERVAL)
+def scheduled_refresh_quotes():
+    """交易時段內定期預先更新報價快取"""
+    with app.app_context():
+        SchedulerService.refresh_quotes()
+
+
+@scheduler.task('interval', id='refresh_recommendations', seconds=Config.RECOMMENDATION_REFRESH_INTERVAL)
+def scheduled_refresh_recommendations():
+    """交易時段內定期預先更新投資建議所需的歷史資料"""
+    with app.app_context():
+        SchedulerService.refresh_recommendations()
+
+
 # ==================== 頁面路由 ====================
 
 @app.route('/')
+@cache.cached(timeout=30, key_prefix=DASHBOARD_CACHE_KEY,
+              unless=lambda: bool(request.args.get('refresh')))
 def index():
     """首頁儀表板"""
     # 市場摘要
     market_summary = StockService.get_market_summary()
     
     # 投資組合
-    db = get_db()
-    portfolio = Portfolio(db)
-    holdings = portfolio.get_all_holdings()
+    portfolio = get_portfolio()
+    holdings = portfolio.get_all_holdings_rows()
+    
+    # 一次批次取得所有持股報價
+    symbols = [holding['symbol'] for holding in holdings]
+    infos = StockService.get_stock_infos(symbols)
     
-    # 計算持股現值
-    portfolio_data = []
-    total_cost = 0
-    total_value = 0
+    # 計算持股現值（以陣列一次計算全部持股）
+    shares = np.asarray([holding['shares'] for holding in holdings], dtype=np.float64)
+    avg_costs = np.asarray([holding['avg_cost'] for holding in holdings], dtype=np.float64)
+    prices = np.asarray([
+        infos.get(holding['symbol'], {}).get('current_price', holding['avg_cost'])
+        for holding in holdings
+    ], dtype=np.float64)
     
-    for holding in holdings:
-        symbol = holding['symbol']
-        shares = holding['shares']
-        avg_cost = holding['avg_cost']
-        
-        try:
-            info = StockService.get_stock_info(symbol)
-            current_price = info.get('current_price', avg_cost)
-        except:
-            current_price = avg_cost
-        
-        cost = shares * avg_cost
-        value = shares * current_price
-        profit = value - cost
-        profit_pct = (profit / cost * 100) if cost > 0 else 0
-        
-        portfolio_data.append({
+    costs = shares * avg_costs
+    values = shares * prices
+    profits = values - costs
+    profit_pcts = np.divide(profits * 100, costs, out=np.zeros_like(profits), where=costs > 0)
+    
+    portfolio_data = [
+        {
             'id': holding['id'],
-            'symbol': symbol,
-            'name': holding.get('name', symbol),
-            'shares': shares,
-            'avg_cost': avg_cost,
+            'symbol': holding['symbol'],
+            'name': holding['name'],
+            'shares': holding['shares'],
+            'avg_cost': holding['avg_cost'],
             'current_price': current_price,
             'cost': cost,
             'value': value,
             'profit': profit,
             'profit_pct': profit_pct,
-            'currency': holding.get('currency', 'USD'),
-        })
-        
-        total_cost += cost
-        total_value += value
+            'currency': holding['currency'],
+        }
+        for holding, current_price, cost, value, profit, profit_pct in zip(
+            holdings, prices.tolist(), costs.tolist(), values.tolist(),
+            profits.tolist(), profit_pcts.tolist())
+    ]
     
+    total_cost = float(costs.sum())
+    total_value = float(values.sum())
     total_profit = total_value - total_cost
     total_profit_pct = (total_profit / total_cost * 100) if total_cost > 0 else 0
     
@@ -109,39 +176,42 @@ def analysis():
     # 取得歷史資料用於圖表
     df = StockService.get_historical_data(symbol, period='6mo')
     
-    chart_data = []
+    # 以欄為單位整批轉換（每個欄位一個陣列）
+    chart_data = {'date': [], 'open': [], 'high': [], 'low': [], 'close': [], 'volume': []}
     if not df.empty:
-        for _, row in df.iterrows():
-            chart_data.append({
-                'date': row['Date'].strftime('%Y-%m-%d') if hasattr(row['Date'], 'strftime') else str(row['Date'])[:10],
-                'open': round(row['Open'], 2),
-                'high': round(row['High'], 2),
-                'low': round(row['Low'], 2),
-                'close': round(row['Close'], 2),
-                'volume': int(row['Volume']),
-            })
+        dates = df['Date']
+        if hasattr(dates, 'dt'):
+            dates = dates.dt.strftime('%Y-%m-%d')
+        else:
+            dates = dates.astype(str).str[:10]
+        chart_data = {
+            'date': dates.tolist(),
+            'open': df['Open'].round(2).tolist(),
+            'high': df['High'].round(2).tolist(),
+            'low': df['Low'].round(2).tolist(),
+            'close': df['Close'].round(2).tolist(),
+            'volume': df['Volume'].astype(np.int64).tolist(),
+        }
     
     # 追蹤清單用於選擇
-    db = get_db()
-    watchlist = Watchlist(db)
+    watchlist = get_watchlist()
     watched = watchlist.get_all()
     
     return render_template('analysis.html',
                          symbol=symbol,
                          recommendation=recommendation,
-                         chart_data=json.dumps(chart_data),
+                         chart_data=orjson.dumps(chart_data).decode(),
                          watchlist=watched,
-                         default_stocks=Config.DEFAULT_US_STOCKS + Config.DEFAULT_TW_STOCKS)
+                         default_stocks=Config.DEFAULT_SYMBOLS)
 
 
 @app.route('/portfolio')
 def portfolio_page():
     """投資組合管理頁面"""
-    db = get_db()
-    portfolio = Portfolio(db)
+    portfolio = get_portfolio()
     holdings = portfolio.get_all_holdings()
     
-    transactions = TransactionLog(db)
+    transactions = get_transaction_log()
     recent_transactions = transactions.get_transactions(limit=20)
     
     return render_template('portfolio.html',
@@ -152,8 +222,7 @@ def portfolio_page():
 @app.route('/risk')
 def risk_page():
     """風險分析頁面"""
-    db = get_db()
-    portfolio = Portfolio(db)
+    portfolio = get_portfolio()
     holdings = portfolio.get_all_holdings()
     
     # 計算投資組合風險
@@ -167,6 +236,7 @@ def risk_page():
 # ==================== API 路由 ====================
 
 @app.route('/api/stock/<symbol>')
+@conditional_json
 def api_stock_info(symbol):
     """取得股票資訊 API"""
     info = StockService.get_stock_info(symbol)
@@ -174,6 +244,8 @@ def api_stock_info(symbol):
 
 
 @app.route('/api/analysis/<symbol>')
+@conditional_json
+@cache.cached(timeout=60)
 def api_analysis(symbol):
     """取得技術分析 API"""
     recommendation = AIAdvisor.get_recommendation(symbol)
@@ -181,17 +253,20 @@ def api_analysis(symbol):
 
 
 @app.route('/api/market')
+@conditional_json
+@cache.cached(timeout=60)
 def api_market():
     """取得市場摘要 API"""
     summary = StockService.get_market_summary()
-    return jsonify(summary)
+    response = jsonify(summary)
+    response.last_modified = (StockService.market_summary_updated_at or datetime.now()).astimezone()
+    return response
 
 
 @app.route('/api/portfolio', methods=['GET'])
 def api_portfolio_list():
     """取得投資組合 API"""
-    db = get_db()
-    portfolio = Portfolio(db)
+    portfolio = get_portfolio()
     holdings = portfolio.get_all_holdings()
     return jsonify(holdings)
 
@@ -200,15 +275,19 @@ def api_portfolio_list():
 def api_portfolio_add():
     """新增持股 API"""
     data = request.json
-    db = get_db()
-    portfolio = Portfolio(db)
+    portfolio = get_portfolio()
+    # 持股與報價快取皆以大寫代碼為鍵
+    symbol = data['symbol'].upper()
     
-    # 取得股票名稱
-    info = StockService.get_stock_info(data['symbol'])
-    name = info.get('name', data['symbol'])
+    # 取得股票名稱（新增持股時強制更新報價）
+    StockService.get_stock_info.invalidate(symbol)
+    info = StockService.get_stock_info(symbol)
+    name = info.get('name', symbol)
+    if 'error' not in info:
+        get_symbol_metadata().upsert(symbol, name, info.get('currency', 'USD'))
     
     holding_id = portfolio.add_holding(
-        symbol=data['symbol'],
+        symbol=symbol,
         name=name,
         shares=float(data['shares']),
         avg_cost=float(data['avg_cost']),
@@ -216,14 +295,15 @@ def api_portfolio_add():
     )
     
     # 記錄交易
-    transactions = TransactionLog(db)
+    transactions = get_transaction_log()
     transactions.add_transaction(
-        symbol=data['symbol'],
+        symbol=symbol,
         trans_type='BUY',
         shares=float(data['shares']),
         price=float(data['avg_cost']),
         currency=data.get('currency', 'USD')
     )
+    cache.delete(DASHBOARD_CACHE_KEY)
     
     return jsonify({'success': True, 'id': holding_id})
 
@@ -231,17 +311,16 @@ def api_portfolio_add():
 @app.route('/api/portfolio/<int:holding_id>', methods=['DELETE'])
 def api_portfolio_delete(holding_id):
     """刪除持股 API"""
-    db = get_db()
-    portfolio = Portfolio(db)
+    portfolio = get_portfolio()
     success = portfolio.delete_holding(holding_id)
+    cache.delete(DASHBOARD_CACHE_KEY)
     return jsonify({'success': success})
 
 
 @app.route('/api/watchlist', methods=['GET'])
 def api_watchlist_list():
     """取得追蹤清單 API"""
-    db = get_db()
-    watchlist = Watchlist(db)
+    watchlist = get_watchlist()
     items = watchlist.get_all()
     return jsonify(items)
 
@@ -250,11 +329,12 @@ def api_watchlist_list():
 def api_watchlist_add():
     """新增追蹤 API"""
     data = request.json
-    db = get_db()
-    watchlist = Watchlist(db)
+    watchlist = get_watchlist()
     
     info = StockService.get_stock_info(data['symbol'])
     name = info.get('name', data['symbol'])
+    if 'error' not in info:
+        get_symbol_metadata().upsert(data['symbol'], name, info.get('currency', 'USD'))
     
     success = watchlist.add_symbol(data['symbol'], name)
     return jsonify({'success': success})
@@ -263,8 +343,7 @@ def api_watchlist_add():
 @app.route('/api/watchlist/<symbol>', methods=['DELETE'])
 def api_watchlist_remove(symbol):
     """移除追蹤 API"""
-    db = get_db()
-    watchlist = Watchlist(db)
+    watchlist = get_watchlist()
     success = watchlist.remove_symbol(symbol)
     return jsonify({'success': success})
 
@@ -286,8 +365,7 @@ def api_recommendations():
 @app.route('/api/risk')
 def api_portfolio_risk():
     """取得投資組合風險分析 API"""
-    db = get_db()
-    portfolio = Portfolio(db)
+    portfolio = get_portfolio()
     holdings = portfolio.get_all_holdings()
     risk_analysis = RiskAnalysisService.analyze_portfolio_risk(holdings)
     return jsonify(risk_analysis)
@@ -307,6 +385,12 @@ def api_stock_risk(symbol):
     })
 
 
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    """取得行情快取命中統計 API"""
+    return jsonify(dict(sorted(cache_stats.items())))
+
+
 # ==================== 啟動應用 ====================
 
 if __name__ == '__main__':
@@ -14,6 +14,30 @@ class Config:
     
     # 資料庫設定
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'data/finance.db')
+    DB_POOL_SIZE = 4  # 請求結束後保留的閒置資料庫連線數
+    
+    # 資料抓取設定
+    FETCH_MAX_WORKERS = 8  # 批次抓取股價時的最大並行數
+    FETCH_RETRIES = 3  # 網路錯誤或限流時的嘗試次數
+    FETCH_RETRY_BASE_DELAY = 0.2  # 重試的起始等待秒數（每次加倍）
+    QUOTE_CACHE_TTL = 120  # 即時報價快取秒數（需大於排程更新間隔）
+    QUOTE_REFRESH_INTERVAL = 90  # 排程預先更新報價快取的間隔秒數
+    RECOMMENDATION_REFRESH_INTERVAL = 240  # 排程預先更新建議用歷史資料的間隔秒數（需小於 HISTORY_CACHE_TTL）
+    # 預先更新報價的交易時段（時區, 開盤, 收盤），週一至週五任一市場開盤時才執行
+    MARKET_SESSIONS = (
+        ('America/New_York', '09:30', '16:00'),  # 美股
+        ('Asia/Taipei', '09:00', '13:30'),  # 台股
+    )
+    HISTORY_CACHE_TTL = 300  # 歷史 K 線快取秒數
+    PROFILE_CACHE_TTL = 24 * 60 * 60  # 名稱、本益比、殖利率等少變動資料的快取秒數
+    PROFILE_ERROR_CACHE_TTL = 5 * 60  # 上述資料抓取失敗時暫停重試的秒數
+    
+    # 磁碟快取設定（程序重啟後沿用行情資料）
+    DISK_CACHE_PATH = os.getenv('DISK_CACHE_PATH', 'data/market_cache.db')
+    
+    # 頁面快取設定
+    CACHE_TYPE = 'SimpleCache'
+    CACHE_DEFAULT_TIMEOUT = 60
     
     # 排程設定
     SCHEDULER_API_ENABLED = True
@@ -21,6 +45,7 @@ class Config:
     # 預設追蹤的股票
     DEFAULT_US_STOCKS = ['AAPL', 'TSLA', 'NVDA', 'GOOGL', 'MSFT']
     DEFAULT_TW_STOCKS = ['2330.TW', '2317.TW', '2454.TW', '2308.TW', '0050.TW']  # 台積電、鴻海、聯發科、台達電、0050
+    DEFAULT_SYMBOLS = tuple(DEFAULT_US_STOCKS + DEFAULT_TW_STOCKS)  # 美股 + 台股（匯入時計算一次）
     
     # 技術分析參數
     RSI_PERIOD = 14
@@ -1,6 +1,14 @@
 """
 Models 模組初始化
 """
-from models.portfolio import Database, Portfolio, Watchlist, TransactionLog, get_db
+from models.portfolio import (
+    Database, Portfolio, Watchlist, TransactionLog, SymbolMetadata, ReportLog,
+    get_db, get_portfolio, get_watchlist, get_transaction_log, get_symbol_metadata,
+    get_report_log,
+)
 
-__all__ = ['Database', 'Portfolio', 'Watchlist', 'TransactionLog', 'get_db']
+__all__ = [
+    'Database', 'Portfolio', 'Watchlist', 'TransactionLog', 'SymbolMetadata', 'ReportLog',
+    'get_db', 'get_portfolio', 'get_watchlist', 'get_transaction_log', 'get_symbol_metadata',
+    'get_report_log',
+]
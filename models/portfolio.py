@@ -3,20 +3,104 @@
 """
 import sqlite3
 import os
+import json
+import threading
 from datetime import datetime
 from typing import List, Dict, Optional
 from config import Config
 
 
+# 常用 SQL 語句（固定字串可命中 sqlite3 的語句快取）
+_SQL_INSERT_HOLDING = '''
+    INSERT INTO holdings (symbol, name, shares, avg_cost, currency)
+    VALUES (?, ?, ?, ?, ?)
+'''
+_SQL_DELETE_HOLDING = 'DELETE FROM holdings WHERE id = ?'
+_SQL_GET_ALL_HOLDINGS = 'SELECT * FROM holdings ORDER BY symbol'
+_SQL_GET_ALL_HOLDING_ROWS = '''
+    SELECT id, symbol, name, shares, avg_cost, currency FROM holdings ORDER BY symbol
+'''
+_SQL_GET_HOLDING_BY_SYMBOL = 'SELECT * FROM holdings WHERE symbol = ?'
+
+_SQL_INSERT_WATCHLIST = 'INSERT INTO watchlist (symbol, name) VALUES (?, ?)'
+_SQL_DELETE_WATCHLIST = 'DELETE FROM watchlist WHERE symbol = ?'
+_SQL_GET_WATCHLIST = 'SELECT * FROM watchlist ORDER BY symbol'
+
+_SQL_UPSERT_METADATA = '''
+    INSERT INTO symbol_metadata (symbol, name, currency) VALUES (?, ?, ?)
+    ON CONFLICT(symbol) DO UPDATE SET
+        name = excluded.name,
+        currency = excluded.currency,
+        updated_at = CURRENT_TIMESTAMP
+'''
+_SQL_GET_METADATA_SYMBOLS = 'SELECT symbol FROM symbol_metadata ORDER BY symbol'
+
+_SQL_INSERT_TRANSACTION = '''
+    INSERT INTO transactions (symbol, type, shares, price, total, currency, note)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_GET_TRANSACTIONS = '''
+    SELECT * FROM transactions ORDER BY transaction_date DESC LIMIT ?
+'''
+_SQL_GET_TRANSACTIONS_BY_SYMBOL = '''
+    SELECT * FROM transactions WHERE symbol = ?
+    ORDER BY transaction_date DESC LIMIT ?
+'''
+
+_SQL_INSERT_REPORT = 'INSERT INTO reports (report_type, content) VALUES (?, ?)'
+
+
 class Database:
     """資料庫管理"""
     
     def __init__(self):
         # 確保目錄存在
         os.makedirs(os.path.dirname(Config.DATABASE_PATH), exist_ok=True)
-        self.conn = sqlite3.connect(Config.DATABASE_PATH, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        # 每個執行緒使用各自的連線，避免跨請求共用同一連線
+        self._local = threading.local()
+        # 請求結束後歸還的閒置連線（開發伺服器每個請求一條新執行緒，沿用連線可省去重新連線與 PRAGMA）
+        self._idle = []
+        self._idle_lock = threading.Lock()
         self._init_tables()
+        self.release()
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """取得目前執行緒的資料庫連線（優先沿用閒置連線）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._idle_lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    def release(self):
+        """歸還目前執行緒的連線；閒置連線已達上限時直接關閉"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        with self._idle_lock:
+            if len(self._idle) < Config.DB_POOL_SIZE:
+                self._idle.append(conn)
+                return
+        conn.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """建立新連線並套用效能設定"""
+        # 連線會在不同請求的執行緒間沿用，但同一時間只由一個執行緒持有
+        conn = sqlite3.connect(Config.DATABASE_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL 讓讀寫可同時進行；NORMAL 在 WAL 下仍能保證一致性
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        return conn
     
     def _init_tables(self):
         """初始化資料表"""
@@ -61,6 +145,22 @@ class Database:
             )
         ''')
         
+        # 交易記錄依日期倒序查詢
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_transactions_date
+            ON transactions (transaction_date DESC)
+        ''')
+        
+        # 股票基本資料表（名稱、幣別等不常變動的資訊）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS symbol_metadata (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                currency TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # 報告歷史表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS reports (
@@ -74,7 +174,11 @@ class Database:
         self.conn.commit()
     
     def close(self):
-        self.conn.close()
+        """關閉目前執行緒的連線"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
 
 class Portfolio:
@@ -86,10 +190,7 @@ class Portfolio:
     def add_holding(self, symbol: str, name: str, shares: float, avg_cost: float, currency: str = 'USD') -> int:
         """新增持股"""
         cursor = self.db.conn.cursor()
-        cursor.execute('''
-            INSERT INTO holdings (symbol, name, shares, avg_cost, currency)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (symbol.upper(), name, shares, avg_cost, currency))
+        cursor.execute(_SQL_INSERT_HOLDING, (symbol.upper(), name, shares, avg_cost, currency))
         self.db.conn.commit()
         return cursor.lastrowid
     
@@ -122,20 +223,31 @@ class Portfolio:
     def delete_holding(self, holding_id: int) -> bool:
         """刪除持股"""
         cursor = self.db.conn.cursor()
-        cursor.execute('DELETE FROM holdings WHERE id = ?', (holding_id,))
+        cursor.execute(_SQL_DELETE_HOLDING, (holding_id,))
         self.db.conn.commit()
         return cursor.rowcount > 0
     
     def get_all_holdings(self) -> List[Dict]:
         """取得所有持股"""
         cursor = self.db.conn.cursor()
-        cursor.execute('SELECT * FROM holdings ORDER BY symbol')
+        cursor.execute(_SQL_GET_ALL_HOLDINGS)
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_all_holdings_rows(self) -> List[sqlite3.Row]:
+        """
+        取得所有持股的原始資料列（唯讀用途）
+        
+        只選取計算損益需要的欄位，並直接回傳 sqlite3.Row，
+        省去逐列建立 dict 的成本；需要序列化時請改用 get_all_holdings。
+        """
+        cursor = self.db.conn.cursor()
+        cursor.execute(_SQL_GET_ALL_HOLDING_ROWS)
+        return cursor.fetchall()
+    
     def get_holding_by_symbol(self, symbol: str) -> Optional[Dict]:
         """依股票代碼取得持股"""
         cursor = self.db.conn.cursor()
-        cursor.execute('SELECT * FROM holdings WHERE symbol = ?', (symbol.upper(),))
+        cursor.execute(_SQL_GET_HOLDING_BY_SYMBOL, (symbol.upper(),))
         row = cursor.fetchone()
         return dict(row) if row else None
 
@@ -150,9 +262,7 @@ class Watchlist:
         """新增追蹤股票"""
         cursor = self.db.conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO watchlist (symbol, name) VALUES (?, ?)
-            ''', (symbol.upper(), name))
+            cursor.execute(_SQL_INSERT_WATCHLIST, (symbol.upper(), name))
             self.db.conn.commit()
             return True
         except sqlite3.IntegrityError:
@@ -161,17 +271,52 @@ class Watchlist:
     def remove_symbol(self, symbol: str) -> bool:
         """移除追蹤股票"""
         cursor = self.db.conn.cursor()
-        cursor.execute('DELETE FROM watchlist WHERE symbol = ?', (symbol.upper(),))
+        cursor.execute(_SQL_DELETE_WATCHLIST, (symbol.upper(),))
         self.db.conn.commit()
         return cursor.rowcount > 0
     
     def get_all(self) -> List[Dict]:
         """取得所有追蹤股票"""
         cursor = self.db.conn.cursor()
-        cursor.execute('SELECT * FROM watchlist ORDER BY symbol')
+        cursor.execute(_SQL_GET_WATCHLIST)
         return [dict(row) for row in cursor.fetchall()]
 
 
+class SymbolMetadata:
+    """股票基本資料（名稱、幣別）"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def upsert(self, symbol: str, name: str, currency: str) -> None:
+        """新增或更新股票基本資料"""
+        self.db.conn.execute(_SQL_UPSERT_METADATA, (symbol.upper(), name, currency))
+        self.db.conn.commit()
+    
+    def get_many(self, symbols: List[str]) -> Dict[str, Dict]:
+        """
+        批次取得股票基本資料
+        
+        Returns:
+            以大寫股票代碼為鍵的 {'symbol', 'name', 'currency'}（查無資料者不列入）
+        """
+        symbols = list({symbol.upper() for symbol in symbols})
+        if not symbols:
+            return {}
+        placeholders = ', '.join('?' * len(symbols))
+        cursor = self.db.conn.cursor()
+        cursor.execute(f'''
+            SELECT symbol, name, currency FROM symbol_metadata WHERE symbol IN ({placeholders})
+        ''', symbols)
+        return {row['symbol']: dict(row) for row in cursor.fetchall()}
+    
+    def get_all_symbols(self) -> List[str]:
+        """取得所有已記錄的股票代碼"""
+        cursor = self.db.conn.cursor()
+        cursor.execute(_SQL_GET_METADATA_SYMBOLS)
+        return [row['symbol'] for row in cursor.fetchall()]
+
+
 class TransactionLog:
     """交易記錄"""
     
@@ -183,10 +328,8 @@ class TransactionLog:
         """新增交易記錄"""
         total = shares * price
         cursor = self.db.conn.cursor()
-        cursor.execute('''
-            INSERT INTO transactions (symbol, type, shares, price, total, currency, note)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (symbol.upper(), trans_type.upper(), shares, price, total, currency, note))
+        cursor.execute(_SQL_INSERT_TRANSACTION,
+                       (symbol.upper(), trans_type.upper(), shares, price, total, currency, note))
         self.db.conn.commit()
         return cursor.lastrowid
     
@@ -194,23 +337,77 @@ class TransactionLog:
         """取得交易記錄"""
         cursor = self.db.conn.cursor()
         if symbol:
-            cursor.execute('''
-                SELECT * FROM transactions WHERE symbol = ? 
-                ORDER BY transaction_date DESC LIMIT ?
-            ''', (symbol.upper(), limit))
+            cursor.execute(_SQL_GET_TRANSACTIONS_BY_SYMBOL, (symbol.upper(), limit))
         else:
-            cursor.execute('''
-                SELECT * FROM transactions ORDER BY transaction_date DESC LIMIT ?
-            ''', (limit,))
+            cursor.execute(_SQL_GET_TRANSACTIONS, (limit,))
         return [dict(row) for row in cursor.fetchall()]
 
 
-# 全域資料庫實例
+class ReportLog:
+    """排程報告記錄"""
+    
+    def __init__(self, db: Database):
+        self.db = db
+    
+    def add_report(self, report_type: str, report: Dict) -> int:
+        """儲存報告（以精簡格式的 JSON 存放）"""
+        content = json.dumps(report, ensure_ascii=False, separators=(',', ':'))
+        with self.db.conn:
+            cursor = self.db.conn.execute(_SQL_INSERT_REPORT, (report_type, content))
+        return cursor.lastrowid
+
+
+# 全域資料庫實例（模型物件只持有 db 參照，與資料庫一同建立並共用）
 _db = None
+_portfolio = None
+_watchlist = None
+_transaction_log = None
+_symbol_metadata = None
+_report_log = None
+_db_lock = threading.Lock()
 
 def get_db() -> Database:
     """取得資料庫實例"""
-    global _db
+    global _db, _portfolio, _watchlist, _transaction_log, _symbol_metadata, _report_log
     if _db is None:
-        _db = Database()
+        with _db_lock:
+            if _db is None:
+                # 各模型實例先建立完成，最後才設定 _db，其他執行緒看到 _db 時實例必已就緒
+                db = Database()
+                _portfolio = Portfolio(db)
+                _watchlist = Watchlist(db)
+                _transaction_log = TransactionLog(db)
+                _symbol_metadata = SymbolMetadata(db)
+                _report_log = ReportLog(db)
+                _db = db
     return _db
+
+
+def get_portfolio() -> Portfolio:
+    """取得投資組合管理實例"""
+    get_db()
+    return _portfolio
+
+
+def get_watchlist() -> Watchlist:
+    """取得追蹤清單管理實例"""
+    get_db()
+    return _watchlist
+
+
+def get_transaction_log() -> TransactionLog:
+    """取得交易記錄實例"""
+    get_db()
+    return _transaction_log
+
+
+def get_symbol_metadata() -> SymbolMetadata:
+    """取得股票基本資料實例"""
+    get_db()
+    return _symbol_metadata
+
+
+def get_report_log() -> ReportLog:
+    """取得報告記錄實例"""
+    get_db()
+    return _report_log
@@ -0,0 +1,17 @@
+"""
+Numba 共用設定 - 數值核心模組共用的 njit 與浮點運算旗標
+"""
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # 未安裝 numba 時以純 Python 執行
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# 允許重排與融合浮點運算以利向量化，但保留 NaN/Inf 語意（資料不足或相關係數無定義時輸出 NaN）
+VECTOR_MATH = {'reassoc', 'contract', 'arcp', 'nsz'}
@@ -0,0 +1,122 @@
+"""
+風險指標數值核心 - 以 Numba 編譯的報酬率統計
+"""
+import numpy as np
+
+from services._numba import HAS_NUMBA, VECTOR_MATH, njit
+
+
+@njit(cache=True, fastmath=VECTOR_MATH, error_model='numpy')
+def core_stats(close: np.ndarray):
+    """
+    單次掃描收盤價，累加日報酬率的平均、變異與最大回撤
+
+    Args:
+        close: 收盤價陣列 (float64)，缺值為 NaN
+
+    Returns:
+        (日波動率, 平均日報酬, 最大回撤, 報酬率筆數)；報酬率以 pct_change().dropna() 定義
+    """
+    count = 0
+    total = 0.0
+    mean = 0.0
+    m2 = 0.0
+    cumulative = 1.0
+    peak = 0.0
+    max_drawdown = 0.0
+
+    for i in range(1, close.shape[0]):
+        r = close[i] / close[i - 1] - 1.0
+        if np.isnan(r):
+            continue
+
+        # Welford 累加變異數
+        count += 1
+        total += r
+        delta = r - mean
+        mean += delta / count
+        m2 += delta * (r - mean)
+
+        # 累積報酬相對歷史高點的跌幅
+        cumulative *= 1.0 + r
+        if count == 1 or cumulative > peak:
+            peak = cumulative
+        drawdown = (cumulative - peak) / peak
+        if drawdown < max_drawdown:
+            max_drawdown = drawdown
+
+    if count == 0:
+        return np.nan, np.nan, np.nan, 0
+    daily_volatility = np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+    return daily_volatility, total / count, max_drawdown, count
+
+
+def core_stats_numpy(close: np.ndarray):
+    """
+    core_stats 的 NumPy 向量化版本（未安裝 numba 時使用，避免純 Python 逐筆迴圈）
+
+    歷史高點以 np.maximum.accumulate 一次掃描取得，回傳格式同 core_stats
+    """
+    returns = close[1:] / close[:-1] - 1.0
+    returns = returns[~np.isnan(returns)]
+    count = returns.shape[0]
+    if count == 0:
+        return np.nan, np.nan, np.nan, 0
+
+    cumulative = np.cumprod(1.0 + returns)
+    peak = np.maximum.accumulate(cumulative)
+    max_drawdown = min(((cumulative - peak) / peak).min(), 0.0)
+    daily_volatility = returns.std(ddof=1) if count > 1 else np.nan
+    return daily_volatility, returns.mean(), max_drawdown, count
+
+
+if not HAS_NUMBA:
+    core_stats = core_stats_numpy
+
+
+@njit(cache=True, fastmath=VECTOR_MATH, error_model='numpy')
+def beta_corr(sx: np.ndarray, mx: np.ndarray):
+    """
+    單次迴圈累加五個交叉和，計算 Beta 與相關係數
+
+    Args:
+        sx: 股票日報酬率
+        mx: 市場日報酬率（與 sx 等長且日期對齊）
+
+    Returns:
+        (beta, correlation)；Beta 為樣本協方差除以市場母體變異數
+    """
+    n = sx.shape[0]
+    sum_s = 0.0
+    sum_m = 0.0
+    sum_sm = 0.0
+    sum_ss = 0.0
+    sum_mm = 0.0
+    for i in range(n):
+        s = sx[i]
+        m = mx[i]
+        sum_s += s
+        sum_m += m
+        sum_sm += s * m
+        sum_ss += s * s
+        sum_mm += m * m
+
+    cross = sum_sm - sum_s * sum_m / n
+    dev_s = sum_ss - sum_s * sum_s / n
+    dev_m = sum_mm - sum_m * sum_m / n
+    covariance = cross / (n - 1)
+    market_variance = dev_m / n
+
+    beta = covariance / market_variance if market_variance != 0 else 0.0
+    denom = np.sqrt(dev_s * dev_m)
+    correlation = cross / denom if denom > 0 else np.nan
+    return beta, correlation
+
+
+# 預先編譯，避免第一個請求承擔 JIT 時間（快取的收盤價陣列為唯讀，兩種版本都編譯）
+_warmup = np.linspace(1.0, 2.0, 30)
+_warmup_readonly = _warmup.copy()
+_warmup_readonly.flags.writeable = False
+core_stats(_warmup)
+core_stats(_warmup_readonly)
+beta_corr(_warmup, _warmup)
@@ -0,0 +1,200 @@
+"""
+技術指標數值核心 - 以 Numba 編譯的純陣列運算
+"""
+import numpy as np
+
+from services._numba import VECTOR_MATH, njit
+
+
+@njit(cache=True)
+def rsi_kernel(close: np.ndarray, period: int) -> np.ndarray:
+    """
+    計算 RSI 序列（漲跌幅取 period 期簡單平均）
+
+    Args:
+        close: 收盤價陣列 (float64)
+        period: RSI 週期
+
+    Returns:
+        與 close 等長的 RSI 陣列，前 period-1 筆為 NaN
+    """
+    n = close.shape[0]
+    out = np.full(n, np.nan)
+    gains = np.zeros(n)
+    losses = np.zeros(n)
+
+    for i in range(1, n):
+        delta = close[i] - close[i - 1]
+        if delta > 0:
+            gains[i] = delta
+        elif delta < 0:
+            losses[i] = -delta
+
+    gain_sum = 0.0
+    loss_sum = 0.0
+    for i in range(n):
+        gain_sum += gains[i]
+        loss_sum += losses[i]
+        if i >= period:
+            gain_sum -= gains[i - period]
+            loss_sum -= losses[i - period]
+        if i >= period - 1:
+            if loss_sum > 0:
+                out[i] = 100.0 - 100.0 / (1.0 + gain_sum / loss_sum)
+            elif gain_sum > 0:
+                out[i] = 100.0
+    return out
+
+
+@njit(cache=True)
+def ewma_kernel(x: np.ndarray, span: int) -> np.ndarray:
+    """
+    指數移動平均（等同 pandas ewm(span, adjust=False).mean()）
+
+    Args:
+        x: 輸入陣列 (float64)
+        span: EMA 週期
+
+    Returns:
+        與 x 等長的 EMA 陣列
+    """
+    alpha = 2.0 / (span + 1.0)
+    out = np.empty_like(x)
+    if x.shape[0] == 0:
+        return out
+    out[0] = x[0]
+    for i in range(1, x.shape[0]):
+        out[i] = alpha * x[i] + (1.0 - alpha) * out[i - 1]
+    return out
+
+
+@njit(cache=True, fastmath=VECTOR_MATH, error_model='numpy')
+def _window_mean_std(close: np.ndarray, period: int):
+    """最後 period 筆的平均與樣本標準差"""
+    n = close.shape[0]
+    total = 0.0
+    for i in range(n - period, n):
+        total += close[i]
+    mean = total / period
+
+    sq = 0.0
+    for i in range(n - period, n):
+        diff = close[i] - mean
+        sq += diff * diff
+    std = np.sqrt(sq / (period - 1)) if period > 1 else np.nan
+    return mean, std
+
+
+@njit(cache=True, fastmath=VECTOR_MATH, error_model='numpy')
+def summary_kernel(close: np.ndarray, rsi_period: int, ema_fast: int, ema_slow: int,
+                   ema_signal: int, ma_short: int, ma_long: int,
+                   bb_period: int, bb_k: float) -> np.ndarray:
+    """
+    單次掃描計算技術摘要所需的最新一根 K 棒指標
+
+    Args:
+        close: 收盤價陣列 (float64)，長度須不小於各週期
+        rsi_period: RSI 週期
+        ema_fast / ema_slow / ema_signal: MACD 快線、慢線、信號線週期
+        ma_short / ma_long: 短期、長期均線週期
+        bb_period / bb_k: 布林通道週期與標準差倍數
+
+    Returns:
+        長度 11 的陣列：收盤價、RSI、MACD、信號線、柱狀圖、短期均線、
+        長期均線、布林上軌、中軌、下軌、布林標準差
+    """
+    n = close.shape[0]
+    out = np.full(11, np.nan)
+    if n == 0:
+        return out
+
+    # MACD：adjust=False 的 EMA 遞迴，只保留最新值
+    alpha_fast = 2.0 / (ema_fast + 1.0)
+    alpha_slow = 2.0 / (ema_slow + 1.0)
+    alpha_signal = 2.0 / (ema_signal + 1.0)
+    fast = close[0]
+    slow = close[0]
+    signal = 0.0
+    for i in range(n):
+        if i > 0:
+            fast = alpha_fast * close[i] + (1.0 - alpha_fast) * fast
+            slow = alpha_slow * close[i] + (1.0 - alpha_slow) * slow
+        macd = fast - slow
+        if i == 0:
+            signal = macd
+        else:
+            signal = alpha_signal * macd + (1.0 - alpha_signal) * signal
+
+    # RSI：最後 rsi_period 期漲跌幅
+    if n >= rsi_period:
+        gain_sum = 0.0
+        loss_sum = 0.0
+        for i in range(max(1, n - rsi_period), n):
+            delta = close[i] - close[i - 1]
+            if delta > 0:
+                gain_sum += delta
+            elif delta < 0:
+                loss_sum -= delta
+        if loss_sum > 0:
+            out[1] = 100.0 - 100.0 / (1.0 + gain_sum / loss_sum)
+        elif gain_sum > 0:
+            out[1] = 100.0
+
+    out[0] = close[n - 1]
+    out[2] = macd
+    out[3] = signal
+    out[4] = macd - signal
+
+    if n >= ma_short:
+        out[5] = _window_mean_std(close, ma_short)[0]
+    if n >= ma_long:
+        out[6] = _window_mean_std(close, ma_long)[0]
+
+    if n >= bb_period:
+        middle, std = _window_mean_std(close, bb_period)
+        out[7] = middle + std * bb_k
+        out[8] = middle
+        out[9] = middle - std * bb_k
+        out[10] = std
+    return out
+
+
+@njit(cache=True)
+def summary_batch_kernel(close_matrix: np.ndarray, rsi_period: int, ema_fast: int,
+                         ema_slow: int, ema_signal: int, ma_short: int, ma_long: int,
+                         bb_period: int, bb_k: float) -> np.ndarray:
+    """
+    對收盤價矩陣的每一欄（一檔股票）計算 summary_kernel
+
+    Args:
+        close_matrix: (交易日數, 股票數) 的收盤價矩陣，缺值為 NaN
+        其餘參數同 summary_kernel
+
+    Returns:
+        (股票數, 11) 的指標矩陣，欄位順序同 summary_kernel
+    """
+    n_days, n_symbols = close_matrix.shape
+    out = np.empty((n_symbols, 11))
+    column = np.empty(n_days)
+    for j in range(n_symbols):
+        # 各市場交易日不同，先去除該股票沒有報價的日期
+        m = 0
+        for i in range(n_days):
+            value = close_matrix[i, j]
+            if not np.isnan(value):
+                column[m] = value
+                m += 1
+        out[j] = summary_kernel(column[:m], rsi_period, ema_fast, ema_slow, ema_signal,
+                                ma_short, ma_long, bb_period, bb_k)
+    return out
+
+
+# 預先編譯，避免第一個請求承擔 JIT 時間（pandas 的 to_numpy 可能回傳唯讀陣列，兩種版本都編譯）
+_warmup = np.linspace(1.0, 2.0, 30)
+_warmup_readonly = _warmup.copy()
+_warmup_readonly.flags.writeable = False
+for _close in (_warmup, _warmup_readonly):
+    rsi_kernel(_close, 14)
+    ewma_kernel(_close, 12)
+    summary_kernel(_close, 14, 12, 26, 9, 20, 60, 20, 2.0)
+    summary_batch_kernel(_close.reshape(15, 2), 14, 12, 26, 9, 20, 60, 20, 2.0)
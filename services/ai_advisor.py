@@ -2,8 +2,10 @@
 AI 投資建議服務 - 基於技術分析生成建議
 """
 from typing import Dict, List
+import numpy as np
 from services.stock_service import StockService
 from services.analysis_service import AnalysisService
+from models.portfolio import get_symbol_metadata
 
 
 class AIAdvisor:
@@ -15,6 +17,47 @@ class AIAdvisor:
         'macd': 0.25,
         'price_position': 0.2,
     }
+    SCORE_KEYS = ('trend', 'rsi', 'macd', 'price_position')
+    WEIGHTS = np.fromiter(map(RECOMMENDATION_WEIGHTS.get, SCORE_KEYS), dtype=np.float64)
+    
+    @staticmethod
+    def _score_indicators(trend, rsi, macd_status, macd_histogram,
+                          close, bb_upper, bb_middle, bb_lower) -> np.ndarray:
+        """
+        將技術指標轉為分數 (-1 到 1)，可傳入單一值或多檔股票的陣列
+        
+        Returns:
+            最後一維依 SCORE_KEYS 排列的分數陣列
+        """
+        trend = np.asarray(trend)
+        rsi = np.asarray(rsi, dtype=np.float64)
+        macd_status = np.asarray(macd_status)
+        macd_histogram = np.asarray(macd_histogram, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        
+        # 趨勢分數
+        trend_score = np.select([trend == 'bullish', trend == 'bearish'], [1.0, -1.0], 0.0)
+        
+        # RSI 分數：超賣可能反彈、超買可能回檔
+        rsi_score = np.select([rsi < 30, rsi > 70, rsi < 40, rsi > 60],
+                              [1.0, -1.0, 0.5, -0.5], 0.0)
+        
+        # MACD 分數
+        macd_score = np.where(macd_status == 'bullish',
+                              np.where(macd_histogram > 0, 0.8, 0.4),
+                              np.where(macd_histogram < 0, -0.8, -0.4))
+        
+        # 價格位置分數（相對於布林通道）
+        position_score = np.select([close < bb_lower, close > bb_upper, close < bb_middle],
+                                   [1.0, -1.0, 0.3], -0.3)
+        
+        return np.stack([trend_score, rsi_score, macd_score, position_score], axis=-1)
+    
+    @staticmethod
+    def _weighted_score(scores: np.ndarray) -> np.ndarray:
+        """依權重加總最後一維的分數"""
+        # 逐項相乘後依序加總，與逐一累加的結果一致（避免內積改變捨入）
+        return (scores * AIAdvisor.WEIGHTS).sum(axis=-1)
     
     @staticmethod
     def get_recommendation(symbol: str) -> Dict:
@@ -27,10 +70,10 @@ class AIAdvisor:
         Returns:
             投資建議
         """
-        # 取得資料
-        info = StockService.get_stock_info(symbol)
-        if 'error' in info:
-            return {'symbol': symbol, 'error': info['error']}
+        # 取得資料（名稱、幣別取自本地資料表，現價取自歷史資料最後一筆）
+        metadata = AIAdvisor._get_metadata([symbol])[symbol]
+        if 'error' in metadata:
+            return {'symbol': symbol, 'error': metadata['error']}
         
         df = StockService.get_historical_data(symbol, period='6mo')
         if df.empty:
@@ -41,57 +84,65 @@ class AIAdvisor:
         if 'error' in analysis:
             return {'symbol': symbol, 'error': analysis['error']}
         
-        # 計算各項分數 (-1 到 1)
-        scores = {}
+        current_price = float(df['Close'].iat[-1])
+        total_score = float(AIAdvisor._score_analyses([analysis])[0])
+        return AIAdvisor._build_recommendation(symbol, metadata, current_price, analysis, total_score)
+    
+    @staticmethod
+    def _get_metadata(symbols: List[str]) -> Dict[str, Dict]:
+        """
+        取得股票名稱與幣別
         
-        # 趨勢分數
-        if analysis['trend'] == 'bullish':
-            scores['trend'] = 1.0
-        elif analysis['trend'] == 'bearish':
-            scores['trend'] = -1.0
-        else:
-            scores['trend'] = 0.0
-        
-        # RSI 分數
-        rsi = analysis['rsi']
-        if rsi < 30:
-            scores['rsi'] = 1.0  # 超賣，可能反彈
-        elif rsi > 70:
-            scores['rsi'] = -1.0  # 超買，可能回檔
-        elif rsi < 40:
-            scores['rsi'] = 0.5
-        elif rsi > 60:
-            scores['rsi'] = -0.5
-        else:
-            scores['rsi'] = 0.0
+        先查詢本地 symbol_metadata 資料表（持股與追蹤清單新增時寫入），查無資料的股票改用
+        已快取的報價資訊，不寫入資料表，避免任意查詢的代碼累積成每日排程的更新對象。
         
-        # MACD 分數
-        if analysis['macd_status'] == 'bullish':
-            scores['macd'] = 0.8 if analysis['macd_histogram'] > 0 else 0.4
-        else:
-            scores['macd'] = -0.8 if analysis['macd_histogram'] < 0 else -0.4
+        Returns:
+            以股票代碼為鍵的 {'name', 'currency'}；無法取得者為 {'error': ...}
+        """
+        store = get_symbol_metadata()
+        known = store.get_many(symbols)
+        missing = [symbol for symbol in symbols if symbol.upper() not in known]
+        infos = StockService.get_stock_infos(missing)
+        
+        results = {}
+        for symbol in symbols:
+            if symbol.upper() in known:
+                results[symbol] = known[symbol.upper()]
+                continue
+            info = infos[symbol]
+            if 'error' in info:
+                results[symbol] = {'error': info['error']}
+                continue
+            results[symbol] = {'name': info.get('name', symbol), 'currency': info.get('currency', 'USD')}
+        return results
+    
+    @staticmethod
+    def _score_analyses(analyses: List[Dict]) -> np.ndarray:
+        """
+        一次計算多份技術分析摘要的加權總分
         
-        # 價格位置分數（相對於布林通道）
-        close = analysis['close']
-        bb_upper = analysis['bb_upper']
-        bb_lower = analysis['bb_lower']
-        bb_middle = analysis['bb_middle']
-        
-        if close < bb_lower:
-            scores['price_position'] = 1.0  # 低於下軌，可能超賣
-        elif close > bb_upper:
-            scores['price_position'] = -1.0  # 高於上軌，可能超買
-        elif close < bb_middle:
-            scores['price_position'] = 0.3
-        else:
-            scores['price_position'] = -0.3
+        Args:
+            analyses: 技術分析摘要列表
         
-        # 加權總分
-        total_score = sum(
-            scores[key] * AIAdvisor.RECOMMENDATION_WEIGHTS[key]
-            for key in scores
+        Returns:
+            與 analyses 等長的總分陣列
+        """
+        scores = AIAdvisor._score_indicators(
+            trend=[a['trend'] for a in analyses],
+            rsi=[a['rsi'] for a in analyses],
+            macd_status=[a['macd_status'] for a in analyses],
+            macd_histogram=[a['macd_histogram'] for a in analyses],
+            close=[a['close'] for a in analyses],
+            bb_upper=[a['bb_upper'] for a in analyses],
+            bb_middle=[a['bb_middle'] for a in analyses],
+            bb_lower=[a['bb_lower'] for a in analyses],
         )
-        
+        return AIAdvisor._weighted_score(scores)
+    
+    @staticmethod
+    def _build_recommendation(symbol: str, metadata: Dict, current_price: float,
+                              analysis: Dict, total_score: float) -> Dict:
+        """依總分與技術分析摘要組成投資建議"""
         # 生成建議
         if total_score >= 0.5:
             recommendation = 'BUY'
@@ -125,9 +176,9 @@ class AIAdvisor:
         
         return {
             'symbol': symbol,
-            'name': info.get('name', symbol),
-            'current_price': info.get('current_price', 0),
-            'currency': info.get('currency', 'USD'),
+            'name': metadata.get('name') or symbol,
+            'current_price': current_price,
+            'currency': metadata.get('currency') or 'USD',
             'recommendation': recommendation,
             'recommendation_zh': recommendation_zh,
             'confidence': round(confidence, 1),
@@ -148,7 +199,36 @@ class AIAdvisor:
         Returns:
             建議列表
         """
-        return [AIAdvisor.get_recommendation(symbol) for symbol in symbols]
+        if not symbols:
+            return []
+        
+        # 歷史收盤價一次下載，再整批計算指標與分數
+        metadata = AIAdvisor._get_metadata(list(dict.fromkeys(symbols)))
+        closes = StockService.get_close_matrix(symbols, period='6mo')
+        analyses = AnalysisService.get_technical_summaries(closes)
+        last_closes = closes.ffill().iloc[-1] if not closes.empty else None
+        
+        results = {}
+        scored_symbols = []
+        for symbol in dict.fromkeys(symbols):
+            analysis = analyses.get(symbol)
+            if 'error' in metadata[symbol]:
+                results[symbol] = {'symbol': symbol, 'error': metadata[symbol]['error']}
+            elif analysis is None:
+                results[symbol] = {'symbol': symbol, 'error': '無法取得歷史資料'}
+            elif 'error' in analysis:
+                results[symbol] = {'symbol': symbol, 'error': analysis['error']}
+            else:
+                scored_symbols.append(symbol)
+        
+        if scored_symbols:
+            total_scores = AIAdvisor._score_analyses([analyses[s] for s in scored_symbols])
+            for symbol, total_score in zip(scored_symbols, total_scores.tolist()):
+                results[symbol] = AIAdvisor._build_recommendation(
+                    symbol, metadata[symbol], float(last_closes[symbol]),
+                    analyses[symbol], total_score)
+        
+        return [results[symbol] for symbol in symbols]
 
 
 # 測試用
@@ -5,11 +5,15 @@ import pandas as pd
 import numpy as np
 from typing import Dict, Tuple
 from config import Config
+from services._ta_kernels import ewma_kernel, rsi_kernel, summary_batch_kernel, summary_kernel
 
 
 class AnalysisService:
     """技術分析服務"""
     
+    BB_PERIOD = 20  # 布林通道週期
+    BB_STD_DEV = 2  # 布林通道標準差倍數
+    
     @staticmethod
     def calculate_rsi(df: pd.DataFrame, period: int = None) -> pd.Series:
         """
@@ -23,12 +27,8 @@ class AnalysisService:
             RSI 序列
         """
         period = period or Config.RSI_PERIOD
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi
+        close = df['Close'].to_numpy(dtype=np.float64)
+        return pd.Series(rsi_kernel(close, period), index=df.index)
     
     @staticmethod
     def calculate_macd(df: pd.DataFrame) -> Tuple[pd.Series, pd.Series, pd.Series]:
@@ -38,12 +38,13 @@ class AnalysisService:
         Returns:
             (MACD線, 信號線, 柱狀圖)
         """
-        ema_fast = df['Close'].ewm(span=Config.MACD_FAST, adjust=False).mean()
-        ema_slow = df['Close'].ewm(span=Config.MACD_SLOW, adjust=False).mean()
-        macd_line = ema_fast - ema_slow
-        signal_line = macd_line.ewm(span=Config.MACD_SIGNAL, adjust=False).mean()
+        close = df['Close'].to_numpy(dtype=np.float64)
+        macd_line = ewma_kernel(close, Config.MACD_FAST) - ewma_kernel(close, Config.MACD_SLOW)
+        signal_line = ewma_kernel(macd_line, Config.MACD_SIGNAL)
         histogram = macd_line - signal_line
-        return macd_line, signal_line, histogram
+        return (pd.Series(macd_line, index=df.index),
+                pd.Series(signal_line, index=df.index),
+                pd.Series(histogram, index=df.index))
     
     @staticmethod
     def calculate_moving_averages(df: pd.DataFrame) -> Dict[str, pd.Series]:
@@ -61,13 +62,15 @@ class AnalysisService:
         }
     
     @staticmethod
-    def calculate_bollinger_bands(df: pd.DataFrame, period: int = 20, std_dev: int = 2) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    def calculate_bollinger_bands(df: pd.DataFrame, period: int = None, std_dev: int = None) -> Tuple[pd.Series, pd.Series, pd.Series]:
         """
         計算布林通道
         
         Returns:
             (上軌, 中軌, 下軌)
         """
+        period = period or AnalysisService.BB_PERIOD
+        std_dev = std_dev or AnalysisService.BB_STD_DEV
         middle = df['Close'].rolling(window=period).mean()
         std = df['Close'].rolling(window=period).std()
         upper = middle + (std * std_dev)
@@ -88,23 +91,64 @@ class AnalysisService:
         if df.empty or len(df) < Config.MA_LONG:
             return {'error': '資料不足，無法進行分析'}
         
-        # 計算各項指標
-        rsi = AnalysisService.calculate_rsi(df)
-        macd_line, signal_line, histogram = AnalysisService.calculate_macd(df)
-        mas = AnalysisService.calculate_moving_averages(df)
-        bb_upper, bb_middle, bb_lower = AnalysisService.calculate_bollinger_bands(df)
+        # 單次掃描計算各項指標的最新值
+        close = df['Close'].to_numpy(dtype=np.float64)
+        values = summary_kernel(close, *AnalysisService._summary_params())
+        return AnalysisService._pack_summary(values)
+    
+    @staticmethod
+    def summary_batch(close_matrix: np.ndarray) -> np.ndarray:
+        """
+        一次計算多檔股票最新一根 K 棒的技術指標
         
-        # 取得最新值
-        latest_close = df['Close'].iloc[-1]
-        latest_rsi = rsi.iloc[-1]
-        latest_macd = macd_line.iloc[-1]
-        latest_signal = signal_line.iloc[-1]
-        latest_histogram = histogram.iloc[-1]
+        Args:
+            close_matrix: (交易日數, 股票數) 的收盤價矩陣，缺值為 NaN
         
-        # 判斷趨勢
-        ma_short = mas[f'MA{Config.MA_SHORT}'].iloc[-1]
-        ma_long = mas[f'MA{Config.MA_LONG}'].iloc[-1]
+        Returns:
+            (股票數, 11) 的指標矩陣
+        """
+        close_matrix = np.ascontiguousarray(close_matrix, dtype=np.float64)
+        return summary_batch_kernel(close_matrix, *AnalysisService._summary_params())
+    
+    @staticmethod
+    def get_technical_summaries(closes: pd.DataFrame) -> Dict[str, Dict]:
+        """
+        批次取得多檔股票的技術分析摘要
+        
+        Args:
+            closes: 以日期為索引、股票代碼為欄位的收盤價 DataFrame
         
+        Returns:
+            以股票代碼為鍵的技術分析摘要（完全沒有資料的股票不列入）
+        """
+        if closes.empty:
+            return {}
+        
+        matrix = closes.to_numpy(dtype=np.float64)
+        values = AnalysisService.summary_batch(matrix)
+        counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+        
+        return {
+            symbol: (AnalysisService._pack_summary(row) if count >= Config.MA_LONG
+                     else {'error': '資料不足，無法進行分析'})
+            for symbol, row, count in zip(closes.columns, values, counts)
+            if count > 0
+        }
+    
+    @staticmethod
+    def _summary_params() -> Tuple:
+        """摘要核心所需的指標週期參數"""
+        return (Config.RSI_PERIOD, Config.MACD_FAST, Config.MACD_SLOW,
+                Config.MACD_SIGNAL, Config.MA_SHORT, Config.MA_LONG,
+                AnalysisService.BB_PERIOD, float(AnalysisService.BB_STD_DEV))
+    
+    @staticmethod
+    def _pack_summary(values: np.ndarray) -> Dict:
+        """將摘要核心輸出的最新指標值整理為分析摘要"""
+        (latest_close, latest_rsi, latest_macd, latest_signal, latest_histogram,
+         ma_short, ma_long, bb_upper, bb_middle, bb_lower, _) = values
+        
+        # 判斷趨勢
         trend = 'neutral'
         if ma_short > ma_long and latest_close > ma_short:
             trend = 'bullish'
@@ -132,9 +176,9 @@ class AnalysisService:
             'ma_short': round(ma_short, 2),
             'ma_long': round(ma_long, 2),
             'trend': trend,
-            'bb_upper': round(bb_upper.iloc[-1], 2),
-            'bb_middle': round(bb_middle.iloc[-1], 2),
-            'bb_lower': round(bb_lower.iloc[-1], 2),
+            'bb_upper': round(bb_upper, 2),
+            'bb_middle': round(bb_middle, 2),
+            'bb_lower': round(bb_lower, 2),
         }
 
 
@@ -0,0 +1,223 @@
+"""
+快取工具 - 行情資料的短期記憶體快取與跨重啟的磁碟快取
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from typing import Any, Callable, Hashable, Optional
+
+from cachetools import TTLCache
+
+from config import Config
+
+
+# 快取命中統計，鍵為 '<函式名稱>:hit' / '<函式名稱>:disk_hit' / '<函式名稱>:negative_hit' / '<函式名稱>:miss'
+cache_stats = Counter()
+
+_MISSING = object()
+
+_SQL_CREATE_ENTRIES = '''
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value BLOB NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (namespace, key)
+    )
+'''
+_SQL_GET_ENTRY = '''
+    SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?
+'''
+_SQL_SET_ENTRY = '''
+    INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at)
+    VALUES (?, ?, ?, ?)
+'''
+_SQL_DELETE_ENTRY = 'DELETE FROM cache_entries WHERE namespace = ? AND key = ?'
+_SQL_DELETE_NAMESPACE = 'DELETE FROM cache_entries WHERE namespace = ?'
+_SQL_PURGE_EXPIRED = 'DELETE FROM cache_entries WHERE expires_at <= ?'
+
+
+class DiskCache:
+    """以 SQLite 保存的 TTL 快取，程序重啟後仍可沿用未過期的結果"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 所有執行緒共用一條連線並以鎖保護（請求與抓取執行緒不必各自開連線）
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._execute(_SQL_CREATE_ENTRIES)
+        self._execute(_SQL_PURGE_EXPIRED, (time.time(),))
+
+    def _execute(self, sql: str, params=()):
+        """執行寫入語句並提交"""
+        with self._lock:
+            self.conn.execute(sql, params)
+            self.conn.commit()
+
+    def get(self, namespace: str, key: str, min_remaining: float = 0) -> Any:
+        """讀取剩餘存活時間超過 min_remaining 秒的項目，不存在時回傳 _MISSING"""
+        with self._lock:
+            row = self.conn.execute(_SQL_GET_ENTRY, (namespace, key, time.time() + min_remaining)).fetchone()
+        return _MISSING if row is None else pickle.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: int):
+        """寫入項目，ttl 秒後過期"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._execute(_SQL_SET_ENTRY, (namespace, key, blob, time.time() + ttl))
+
+    def delete(self, namespace: str, key: str):
+        """移除單一項目"""
+        self._execute(_SQL_DELETE_ENTRY, (namespace, key))
+
+    def clear(self, namespace: str):
+        """移除整個命名空間"""
+        self._execute(_SQL_DELETE_NAMESPACE, (namespace,))
+
+
+_disk_cache: Optional[DiskCache] = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache() -> DiskCache:
+    """取得共用的磁碟快取（首次使用時才建立檔案）"""
+    global _disk_cache
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = DiskCache(Config.DISK_CACHE_PATH)
+    return _disk_cache
+
+
+def ttl_cached(ttl: int, maxsize: int = 512,
+               key: Optional[Callable[..., Hashable]] = None,
+               should_cache: Optional[Callable[[Any], bool]] = None,
+               disk_ttl: Optional[int] = None,
+               negative_ttl: Optional[int] = None):
+    """
+    以 TTL 快取函式結果的裝飾器
+
+    Args:
+        ttl: 快取存活秒數
+        maxsize: 最大快取筆數
+        key: 由呼叫參數產生快取鍵的函式（預設使用全部參數）
+        should_cache: 判斷結果是否寫入快取（例如錯誤結果不快取）
+        disk_ttl: 另存於磁碟快取的秒數（預設不使用）；記憶體未命中時只採用寫入不到 ttl 秒的
+            磁碟項目，磁碟層僅用來預熱剛重啟的程序，不會延長資料的新鮮度
+        negative_ttl: should_cache 拒絕的結果（例如錯誤）在記憶體中短暫保留的秒數，
+            避免持續失敗的呼叫每次都重新抓取（預設不保留）
+
+    Returns:
+        裝飾後的函式，另提供 refresh(*args)、invalidate(*args) 與 cache_clear() 方法
+    """
+    def decorator(func):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        negative_cache = TTLCache(maxsize=maxsize, ttl=negative_ttl) if negative_ttl else None
+        lock = threading.Lock()
+        name = func.__qualname__
+        make_key = key or (lambda *args, **kwargs: (args, tuple(sorted(kwargs.items()))))
+
+        def disk_get(cache_key):
+            if not disk_ttl:
+                return _MISSING
+            try:
+                # 剩餘時間超過 disk_ttl - ttl 即代表寫入未滿 ttl 秒
+                return get_disk_cache().get(name, str(cache_key), max(disk_ttl - ttl, 0))
+            except Exception:
+                return _MISSING
+
+        def store(cache_key, value):
+            if should_cache is not None and not should_cache(value):
+                if negative_cache is not None:
+                    with lock:
+                        negative_cache[cache_key] = value
+                return
+            with lock:
+                cache[cache_key] = value
+                if negative_cache is not None:
+                    negative_cache.pop(cache_key, None)
+            if disk_ttl:
+                try:
+                    get_disk_cache().set(name, str(cache_key), value, disk_ttl)
+                except Exception:
+                    pass
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                cache_key = make_key(*args, **kwargs)
+                with lock:
+                    value = cache.get(cache_key, _MISSING)
+                    negative = _MISSING if negative_cache is None else negative_cache.get(cache_key, _MISSING)
+            except Exception:
+                # 快取本身出錯時直接走原始呼叫
+                return func(*args, **kwargs)
+
+            if value is not _MISSING:
+                cache_stats[f'{name}:hit'] += 1
+                return value
+            if negative is not _MISSING:
+                cache_stats[f'{name}:negative_hit'] += 1
+                return negative
+
+            # 記憶體未命中時沿用磁碟上的結果（例如程序剛重啟）
+            value = disk_get(cache_key)
+            if value is not _MISSING:
+                cache_stats[f'{name}:disk_hit'] += 1
+                with lock:
+                    cache[cache_key] = value
+                return value
+
+            cache_stats[f'{name}:miss'] += 1
+            value = func(*args, **kwargs)
+            try:
+                store(cache_key, value)
+            except Exception:
+                pass
+            return value
+
+        def refresh(*args, **kwargs):
+            """略過快取重新呼叫，並以新結果覆寫快取"""
+            value = func(*args, **kwargs)
+            store(make_key(*args, **kwargs), value)
+            return value
+
+        def invalidate(*args, **kwargs):
+            """移除指定參數的快取"""
+            cache_key = make_key(*args, **kwargs)
+            with lock:
+                cache.pop(cache_key, None)
+                if negative_cache is not None:
+                    negative_cache.pop(cache_key, None)
+            if disk_ttl:
+                try:
+                    get_disk_cache().delete(name, str(cache_key))
+                except Exception:
+                    pass
+
+        def cache_clear():
+            """清除全部快取"""
+            with lock:
+                cache.clear()
+                if negative_cache is not None:
+                    negative_cache.clear()
+            if disk_ttl:
+                try:
+                    get_disk_cache().clear(name)
+                except Exception:
+                    pass
+
+        wrapper.refresh = refresh
+        wrapper.invalidate = invalidate
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
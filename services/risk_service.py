@@ -2,18 +2,113 @@
 投資組合風險分析服務
 計算波動率、Beta、夏普比率、分散度等風險指標
 """
+import math
 import numpy as np
 import pandas as pd
-from typing import Dict, List
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, List, Tuple
+from config import Config
+from services._risk_kernels import beta_corr, core_stats
+from services.cache import ttl_cached
 from services.stock_service import StockService
 
 
+# 年化參數：一年 252 個交易日
+_TRADING_DAYS = 252
+_SQRT252 = math.sqrt(_TRADING_DAYS)
+
+# 解讀門檻（由小到大）與對應說明；數值須「大於」門檻才進入下一級
+_BETA_THRESHOLDS = (0.5, 0.8, 1.0, 1.5)
+_BETA_MESSAGES = (
+    '防禦型：波動遠小於市場',
+    '較低風險：波動小於市場',
+    '中等風險：與市場波動接近',
+    '較高風險：波動略大於市場',
+    '高風險：波動遠大於市場',
+)
+_SHARPE_THRESHOLDS = (0, 1, 2)
+_SHARPE_MESSAGES = (
+    '差：風險調整後為負報酬',
+    '普通：正報酬但風險調整後一般',
+    '良好：優於無風險投資',
+    '優秀：極佳的風險調整報酬',
+)
+
+
 class RiskAnalysisService:
     """投資組合風險分析服務"""
     
     RISK_FREE_RATE = 0.05  # 無風險利率假設 5%（年化）
     MARKET_INDEX = '^GSPC'  # S&P 500 作為市場基準
     
+    @staticmethod
+    def _core_stats(close: np.ndarray) -> Dict:
+        """
+        單次掃描收盤價，計算波動率、報酬、最大回撤與夏普比率
+        
+        Args:
+            close: 收盤價陣列 (float64)
+        
+        Returns:
+            各項統計（未四捨五入，皆為小數而非百分比）
+        """
+        daily_volatility, mean_return, max_drawdown, data_points = core_stats(close)
+        annual_volatility = daily_volatility * _SQRT252
+        annual_return = mean_return * _TRADING_DAYS
+        
+        sharpe = (annual_return - RiskAnalysisService.RISK_FREE_RATE) / annual_volatility if annual_volatility != 0 else 0
+        
+        return {
+            'daily_volatility': daily_volatility,
+            'annual_volatility': annual_volatility,
+            'max_drawdown': max_drawdown,
+            'mean_return': mean_return,
+            'annual_return': annual_return,
+            'sharpe': sharpe,
+            'data_points': data_points,
+        }
+    
+    @staticmethod
+    def _to_history(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        取出交易日期與收盤價陣列
+        
+        Returns:
+            (日期 datetime64[D]，以交易所當地日期為準, 收盤價 float64)；無資料時皆為空陣列
+        """
+        if df.empty:
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0)
+        # get_historical_data 已 reset_index，日期在 Date 欄（分鐘線為 Datetime 欄）
+        dates = pd.DatetimeIndex(df['Date'] if 'Date' in df.columns else df['Datetime'])
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        return dates.to_numpy().astype('datetime64[D]'), df['Close'].to_numpy(dtype=np.float64)
+    
+    @staticmethod
+    @ttl_cached(ttl=Config.HISTORY_CACHE_TTL,
+                key=lambda symbol, period='1y': f'{symbol}:{period}:{date.today().isoformat()}',
+                should_cache=lambda history: len(history[1]) > 0)
+    def _fetch_history(symbol: str, period: str = '1y') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        取得歷史資料並轉為 (日期, 收盤價) 陣列
+        
+        轉換結果在程序內快取（換日即失效），重複分析同一股票時不必再轉換 DataFrame；
+        陣列設為唯讀，供各執行緒共用
+        """
+        dates, close = RiskAnalysisService._to_history(StockService.get_historical_data(symbol, period=period))
+        dates.flags.writeable = False
+        close.flags.writeable = False
+        return dates, close
+    
+    @staticmethod
+    def _dated_returns(dates: np.ndarray, close: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """日報酬率（等同 pct_change().dropna()）及其對應日期"""
+        returns = close[1:] / close[:-1] - 1
+        valid = ~np.isnan(returns)
+        return dates[1:][valid], returns[valid]
+    
     @staticmethod
     def calculate_volatility(symbol: str, period: str = '1y') -> Dict:
         """
@@ -26,32 +121,28 @@ class RiskAnalysisService:
         Returns:
             波動率資訊
         """
-        df = StockService.get_historical_data(symbol, period=period)
-        if df.empty or len(df) < 20:
+        _, close = RiskAnalysisService._fetch_history(symbol, period)
+        return RiskAnalysisService._volatility_from_close(symbol, close)
+    
+    @staticmethod
+    def _volatility_from_close(symbol: str, close: np.ndarray) -> Dict:
+        """由收盤價陣列計算波動率"""
+        if len(close) < 20:
             return {'symbol': symbol, 'error': '資料不足'}
         
-        # 計算日報酬率
-        returns = df['Close'].pct_change().dropna()
-        
-        # 日波動率（標準差）
-        daily_volatility = returns.std()
-        
-        # 年化波動率（假設一年 252 個交易日）
-        annual_volatility = daily_volatility * np.sqrt(252)
-        
-        # 計算最大回撤
-        cumulative = (1 + returns).cumprod()
-        peak = cumulative.expanding(min_periods=1).max()
-        drawdown = (cumulative - peak) / peak
-        max_drawdown = drawdown.min()
-        
+        stats = RiskAnalysisService._core_stats(close)
+        return RiskAnalysisService._volatility_result(symbol, stats)
+    
+    @staticmethod
+    def _volatility_result(symbol: str, stats: Dict) -> Dict:
+        """將 _core_stats 結果整理為波動率資訊（年化以 _TRADING_DAYS 個交易日計）"""
         return {
             'symbol': symbol,
-            'daily_volatility': round(daily_volatility * 100, 2),
-            'annual_volatility': round(annual_volatility * 100, 2),
-            'max_drawdown': round(max_drawdown * 100, 2),
-            'avg_daily_return': round(returns.mean() * 100, 4),
-            'data_points': len(returns),
+            'daily_volatility': round(stats['daily_volatility'] * 100, 2),
+            'annual_volatility': round(stats['annual_volatility'] * 100, 2),
+            'max_drawdown': round(stats['max_drawdown'] * 100, 2),
+            'avg_daily_return': round(stats['mean_return'] * 100, 4),
+            'data_points': stats['data_points'],
         }
     
     @staticmethod
@@ -66,34 +157,37 @@ class RiskAnalysisService:
         Returns:
             Beta 值資訊
         """
-        # 取得股票資料
-        stock_df = StockService.get_historical_data(symbol, period=period)
-        market_df = StockService.get_historical_data(RiskAnalysisService.MARKET_INDEX, period=period)
+        # 取得股票資料；資料不足時不必再抓市場指數
+        stock = RiskAnalysisService._fetch_history(symbol, period)
+        if len(stock[1]) == 0:
+            return {'symbol': symbol, 'error': '無法取得資料'}
+        if len(stock[1]) <= 20:
+            return {'symbol': symbol, 'error': '資料點不足'}
         
-        if stock_df.empty or market_df.empty:
+        market = RiskAnalysisService._fetch_history(RiskAnalysisService.MARKET_INDEX, period)
+        return RiskAnalysisService._beta_from_history(symbol, stock, market)
+    
+    @staticmethod
+    def _beta_from_history(symbol: str, stock: Tuple[np.ndarray, np.ndarray],
+                           market: Tuple[np.ndarray, np.ndarray]) -> Dict:
+        """由股票與市場的 (日期, 收盤價) 陣列計算 Beta"""
+        if len(stock[1]) == 0 or len(market[1]) == 0:
             return {'symbol': symbol, 'error': '無法取得資料'}
         
         # 計算報酬率
-        stock_returns = stock_df['Close'].pct_change().dropna()
-        market_returns = market_df['Close'].pct_change().dropna()
+        stock_dates, stock_returns = RiskAnalysisService._dated_returns(*stock)
+        market_dates, market_returns = RiskAnalysisService._dated_returns(*market)
         
-        # 對齊日期
-        min_len = min(len(stock_returns), len(market_returns))
-        stock_returns = stock_returns.iloc[-min_len:]
-        market_returns = market_returns.iloc[-min_len:]
+        # 依日期對齊（兩邊都有報酬率的交易日），避免休市日不同造成錯位
+        _, stock_idx, market_idx = np.intersect1d(stock_dates, market_dates,
+                                                  assume_unique=True, return_indices=True)
+        stock_returns = stock_returns[stock_idx]
+        market_returns = market_returns[market_idx]
         
         if len(stock_returns) < 20:
             return {'symbol': symbol, 'error': '資料點不足'}
         
-        # 計算協方差和市場變異數
-        covariance = np.cov(stock_returns, market_returns)[0][1]
-        market_variance = np.var(market_returns)
-        
-        # Beta = Cov(stock, market) / Var(market)
-        beta = covariance / market_variance if market_variance != 0 else 0
-        
-        # 計算相關係數
-        correlation = np.corrcoef(stock_returns, market_returns)[0][1]
+        beta, correlation = RiskAnalysisService._beta_corr(stock_returns, market_returns)
         
         return {
             'symbol': symbol,
@@ -102,19 +196,25 @@ class RiskAnalysisService:
             'interpretation': RiskAnalysisService._interpret_beta(beta),
         }
     
+    @staticmethod
+    def _beta_corr(sx: np.ndarray, mx: np.ndarray) -> Tuple[float, float]:
+        """
+        以單次累加的交叉和計算 Beta 與相關係數（Numba 核心）
+        
+        Args:
+            sx: 股票日報酬率
+            mx: 市場日報酬率（與 sx 等長且日期對齊）
+        
+        Returns:
+            (beta, correlation)
+        """
+        return beta_corr(sx, mx)
+    
     @staticmethod
     def _interpret_beta(beta: float) -> str:
         """解釋 Beta 值意義"""
-        if beta > 1.5:
-            return '高風險：波動遠大於市場'
-        elif beta > 1.0:
-            return '較高風險：波動略大於市場'
-        elif beta > 0.8:
-            return '中等風險：與市場波動接近'
-        elif beta > 0.5:
-            return '較低風險：波動小於市場'
-        else:
-            return '防禦型：波動遠小於市場'
+        # bisect_left 即「大於幾個門檻」，等同原本的 > 判斷鏈（NaN 落在最低級）
+        return _BETA_MESSAGES[bisect_left(_BETA_THRESHOLDS, beta)]
     
     @staticmethod
     def calculate_sharpe_ratio(symbol: str, period: str = '1y') -> Dict:
@@ -123,40 +223,68 @@ class RiskAnalysisService:
         
         Sharpe Ratio = (Return - Risk Free Rate) / Volatility
         """
-        df = StockService.get_historical_data(symbol, period=period)
-        if df.empty or len(df) < 20:
+        _, close = RiskAnalysisService._fetch_history(symbol, period)
+        return RiskAnalysisService._sharpe_from_close(symbol, close)
+    
+    @staticmethod
+    def _sharpe_from_close(symbol: str, close: np.ndarray) -> Dict:
+        """由收盤價陣列計算夏普比率"""
+        if len(close) < 20:
             return {'symbol': symbol, 'error': '資料不足'}
         
-        returns = df['Close'].pct_change().dropna()
-        
-        # 年化報酬率
-        annual_return = returns.mean() * 252
-        
-        # 年化波動率
-        annual_volatility = returns.std() * np.sqrt(252)
-        
-        # 夏普比率
-        sharpe = (annual_return - RiskAnalysisService.RISK_FREE_RATE) / annual_volatility if annual_volatility != 0 else 0
-        
+        stats = RiskAnalysisService._core_stats(close)
+        return RiskAnalysisService._sharpe_result(symbol, stats)
+    
+    @staticmethod
+    def _sharpe_result(symbol: str, stats: Dict) -> Dict:
+        """將 _core_stats 結果整理為夏普比率資訊"""
+        sharpe = stats['sharpe']
         return {
             'symbol': symbol,
             'sharpe_ratio': round(sharpe, 2),
-            'annual_return': round(annual_return * 100, 2),
-            'annual_volatility': round(annual_volatility * 100, 2),
+            'annual_return': round(stats['annual_return'] * 100, 2),
+            'annual_volatility': round(stats['annual_volatility'] * 100, 2),
             'interpretation': RiskAnalysisService._interpret_sharpe(sharpe),
         }
     
     @staticmethod
     def _interpret_sharpe(sharpe: float) -> str:
         """解釋夏普比率"""
-        if sharpe > 2:
-            return '優秀：極佳的風險調整報酬'
-        elif sharpe > 1:
-            return '良好：優於無風險投資'
-        elif sharpe > 0:
-            return '普通：正報酬但風險調整後一般'
-        else:
-            return '差：風險調整後為負報酬'
+        return _SHARPE_MESSAGES[bisect_left(_SHARPE_THRESHOLDS, sharpe)]
+    
+    @staticmethod
+    def _compute_risk(symbol: str, stock: Tuple[np.ndarray, np.ndarray],
+                      market: Tuple[np.ndarray, np.ndarray]) -> Dict:
+        """
+        以同一份歷史資料一次計算波動率、Beta 與夏普比率
+        
+        Args:
+            symbol: 股票代碼
+            stock: 股票的 (日期, 收盤價)
+            market: 市場基準的 (日期, 收盤價)
+        
+        Returns:
+            {'volatility', 'beta', 'sharpe', 'max_drawdown'}，無法計算的項目取預設值
+        """
+        beta_data = RiskAnalysisService._beta_from_history(symbol, stock, market)
+        metrics = {
+            'volatility': 0,
+            'beta': beta_data.get('beta', 1),
+            'sharpe': 0,
+            'max_drawdown': 0,
+        }
+        
+        close = stock[1]
+        if len(close) < 20:
+            return metrics
+        
+        # 報酬率相關統計只算一次，波動率與夏普比率共用
+        stats = RiskAnalysisService._core_stats(close)
+        vol_data = RiskAnalysisService._volatility_result(symbol, stats)
+        metrics['volatility'] = vol_data['annual_volatility']
+        metrics['max_drawdown'] = vol_data['max_drawdown']
+        metrics['sharpe'] = round(stats['sharpe'], 2)
+        return metrics
     
     @staticmethod
     def analyze_portfolio_risk(holdings: List[Dict]) -> Dict:
@@ -172,68 +300,67 @@ class RiskAnalysisService:
         if not holdings:
             return {'error': '無持股資料'}
         
-        # 計算各持股現值和權重
+        # 報價一次並行取得，同一迴圈累計各持股現值
+        infos = StockService.get_stock_infos([holding['symbol'] for holding in holdings])
         portfolio_value = 0
-        stock_data = []
+        symbols = []
+        values = []
         
         for holding in holdings:
             symbol = holding['symbol']
-            shares = holding['shares']
-            
             try:
-                info = StockService.get_stock_info(symbol)
-                current_price = info.get('current_price', holding['avg_cost'])
-                value = shares * current_price
-                
-                stock_data.append({
-                    'symbol': symbol,
-                    'value': value,
-                    'shares': shares,
-                    'price': current_price,
-                })
-                portfolio_value += value
-            except:
+                current_price = infos[symbol].get('current_price', holding['avg_cost'])
+                value = holding['shares'] * current_price
+            except (KeyError, TypeError, ValueError):
+                # 報價欄位缺漏或非數值時略過該持股
                 continue
+            symbols.append(symbol)
+            values.append(value)
+            portfolio_value += value
         
         if portfolio_value == 0:
             return {'error': '無法計算投組價值'}
         
         # 計算各股權重
-        for stock in stock_data:
-            stock['weight'] = stock['value'] / portfolio_value
+        count = len(symbols)
+        weights = np.fromiter(values, dtype=np.float64, count=count) / portfolio_value
+        
+        # 各持股的歷史資料並行抓取
+        workers = min(Config.FETCH_MAX_WORKERS, count)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            histories = list(executor.map(RiskAnalysisService._fetch_history, symbols))
+        
+        # 市場基準只取一次，且所有持股資料都不足以計算 Beta 時就不抓
+        if any(len(close) > 20 for _, close in histories):
+            market = RiskAnalysisService._fetch_history(RiskAnalysisService.MARKET_INDEX)
+        else:
+            market = RiskAnalysisService._to_history(pd.DataFrame())
         
-        # 計算各股風險指標
+        # 計算各股風險指標，同時填入加權用的陣列
         risk_metrics = []
-        total_weighted_volatility = 0
-        total_weighted_beta = 0
+        volatilities = np.empty(count)
+        betas = np.empty(count)
         
-        for stock in stock_data:
-            symbol = stock['symbol']
-            weight = stock['weight']
-            
-            vol_data = RiskAnalysisService.calculate_volatility(symbol)
-            beta_data = RiskAnalysisService.calculate_beta(symbol)
-            sharpe_data = RiskAnalysisService.calculate_sharpe_ratio(symbol)
-            
-            volatility = vol_data.get('annual_volatility', 0)
-            beta = beta_data.get('beta', 1)
-            sharpe = sharpe_data.get('sharpe_ratio', 0)
-            max_dd = vol_data.get('max_drawdown', 0)
-            
-            total_weighted_volatility += weight * volatility
-            total_weighted_beta += weight * beta
+        for i, (symbol, history, weight) in enumerate(zip(symbols, histories, weights.tolist())):
+            metrics = RiskAnalysisService._compute_risk(symbol, history, market)
+            volatilities[i] = metrics['volatility']
+            betas[i] = metrics['beta']
             
             risk_metrics.append({
                 'symbol': symbol,
                 'weight': round(weight * 100, 1),
-                'volatility': volatility,
-                'beta': beta,
-                'sharpe': sharpe,
-                'max_drawdown': max_dd,
+                'volatility': metrics['volatility'],
+                'beta': metrics['beta'],
+                'sharpe': metrics['sharpe'],
+                'max_drawdown': metrics['max_drawdown'],
             })
         
+        # 加權波動率、加權 Beta 與 HHI 皆為權重向量的內積
+        total_weighted_volatility = float(weights @ volatilities)
+        total_weighted_beta = float(weights @ betas)
+        
         # 計算分散度 (使用 Herfindahl Index)
-        hhi = sum(stock['weight'] ** 2 for stock in stock_data)
+        hhi = float(weights @ weights)
         diversification_score = round((1 - hhi) * 100, 1)  # 越高越分散
         
         # 評估整體風險等級
@@ -252,7 +379,7 @@ class RiskAnalysisService:
         
         return {
             'portfolio_value': round(portfolio_value, 2),
-            'holdings_count': len(stock_data),
+            'holdings_count': count,
             'portfolio_beta': portfolio_beta,
             'portfolio_volatility': portfolio_volatility,
             'diversification_score': diversification_score,
@@ -1,17 +1,98 @@
 """
 定期排程服務
 """
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
 from config import Config
 from services.stock_service import StockService
 from services.ai_advisor import AIAdvisor
-from models.portfolio import get_db, Portfolio, Watchlist
+from models.portfolio import get_portfolio, get_watchlist, get_symbol_metadata, get_report_log
 
 
 class SchedulerService:
     """定期排程服務"""
     
+    @staticmethod
+    def is_market_open(now: Optional[datetime] = None) -> bool:
+        """
+        判斷美股或台股是否在交易時段內（不含國定假日）
+        
+        Args:
+            now: 判斷的時間點（預設為現在）
+        
+        Returns:
+            任一市場開盤中時為 True
+        """
+        now = now or datetime.now().astimezone()
+        for tz, open_at, close_at in Config.MARKET_SESSIONS:
+            local = now.astimezone(ZoneInfo(tz))
+            if local.weekday() < 5 and time.fromisoformat(open_at) <= local.time() <= time.fromisoformat(close_at):
+                return True
+        return False
+    
+    @staticmethod
+    def refresh_quotes() -> int:
+        """
+        預先更新報價快取（預設清單、追蹤清單與持股），讓請求直接讀取快取
+        
+        美股與台股皆收盤時報價不會變動，直接略過
+        
+        Returns:
+            更新的股票數量
+        """
+        if not SchedulerService.is_market_open():
+            return 0
+        
+        watched = [item['symbol'] for item in get_watchlist().get_all()]
+        held = [item['symbol'] for item in get_portfolio().get_all_holdings()]
+        symbols = [*Config.DEFAULT_SYMBOLS, *watched, *held]
+        
+        infos = StockService.get_stock_infos(symbols, refresh=True)
+        StockService.get_market_summary.refresh()
+        return len(infos)
+    
+    @staticmethod
+    def refresh_recommendations() -> int:
+        """
+        預先更新投資建議所需的歷史資料快取，讓 /api/recommendations 與 /api/analysis 直接讀取快取
+        
+        批次建議使用的收盤價矩陣與個股分析使用的 6 個月 K 線都會更新；收盤時段略過
+        
+        Returns:
+            更新的股票數量
+        """
+        if not SchedulerService.is_market_open():
+            return 0
+        
+        symbols = SchedulerService._recommendation_symbols()
+        StockService.get_close_matrix.refresh(symbols, period='6mo')
+        
+        workers = min(Config.FETCH_MAX_WORKERS, len(symbols))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda symbol: StockService.get_historical_data.refresh(symbol, period='6mo'), symbols))
+        return len(symbols)
+    
+    @staticmethod
+    def refresh_symbol_metadata() -> int:
+        """
+        重新抓取已記錄股票的名稱與幣別
+        
+        Returns:
+            更新的股票數量
+        """
+        store = get_symbol_metadata()
+        infos = StockService.get_stock_infos(store.get_all_symbols())
+        updated = 0
+        for symbol, info in infos.items():
+            if 'error' not in info:
+                # 名稱平時取自 24 小時快取，這裡略過快取重新抓取並覆寫快取
+                profile = StockService._get_profile.refresh(symbol)
+                store.upsert(symbol, profile.get('name', info.get('name', symbol)), info.get('currency', 'USD'))
+                updated += 1
+        return updated
+    
     @staticmethod
     def generate_daily_report() -> Dict:
         """
@@ -28,15 +109,21 @@ class SchedulerService:
         # 市場摘要
         report['market_summary'] = StockService.get_market_summary()
         
-        # 追蹤清單更新
-        db = get_db()
-        watchlist = Watchlist(db)
+        watchlist = get_watchlist()
         watched_symbols = [item['symbol'] for item in watchlist.get_all()]
+        portfolio = get_portfolio()
+        holdings = portfolio.get_all_holdings()
+        
+        # 追蹤清單與持股的報價一次並行取得（通常已由 refresh_quotes 預熱快取）
+        infos = StockService.get_stock_infos(
+            [*watched_symbols, *(holding['symbol'] for holding in holdings)]
+        )
         
+        # 追蹤清單更新
         if watched_symbols:
             for symbol in watched_symbols:
                 try:
-                    info = StockService.get_stock_info(symbol)
+                    info = infos[symbol]
                     if 'error' not in info:
                         previous = info.get('previous_close', 0)
                         current = info.get('current_price', 0)
@@ -55,9 +142,6 @@ class SchedulerService:
                     print(f"Error fetching {symbol}: {e}")
         
         # 投資組合摘要
-        portfolio = Portfolio(db)
-        holdings = portfolio.get_all_holdings()
-        
         total_cost = 0
         total_value = 0
         
@@ -67,7 +151,7 @@ class SchedulerService:
             avg_cost = holding['avg_cost']
             
             try:
-                info = StockService.get_stock_info(symbol)
+                info = infos[symbol]
                 current_price = info.get('current_price', avg_cost)
                 
                 cost = shares * avg_cost
@@ -75,7 +159,8 @@ class SchedulerService:
                 
                 total_cost += cost
                 total_value += value
-            except:
+            except (KeyError, TypeError, ValueError):
+                # 報價欄位缺漏或非數值時以成本計算
                 total_cost += shares * avg_cost
                 total_value += shares * avg_cost
         
@@ -92,13 +177,8 @@ class SchedulerService:
             'holdings_count': len(holdings),
         }
         
-        # 儲存報告
-        cursor = db.conn.cursor()
-        import json
-        cursor.execute('''
-            INSERT INTO reports (report_type, content) VALUES (?, ?)
-        ''', ('daily', json.dumps(report, ensure_ascii=False)))
-        db.conn.commit()
+        # 儲存報告（與其他模型共用同一資料庫連線）
+        get_report_log().add_report('daily', report)
         
         return report
     
@@ -107,11 +187,18 @@ class SchedulerService:
         """
         生成投資建議
         """
-        db = get_db()
-        
+        all_symbols = SchedulerService._recommendation_symbols()
+        recommendations = AIAdvisor.get_portfolio_recommendations(all_symbols)
+        return recommendations
+    
+    @staticmethod
+    def _recommendation_symbols() -> List[str]:
+        """
+        取得投資建議涵蓋的股票（預熱快取與產生建議共用，確保快取鍵一致）
+        """
         # 從追蹤清單和持股中取得股票
-        watchlist = Watchlist(db)
-        portfolio = Portfolio(db)
+        watchlist = get_watchlist()
+        portfolio = get_portfolio()
         
         watched = [item['symbol'] for item in watchlist.get_all()]
         held = [item['symbol'] for item in portfolio.get_all_holdings()]
@@ -123,8 +210,7 @@ class SchedulerService:
         if not all_symbols:
             all_symbols = Config.DEFAULT_US_STOCKS[:3] + Config.DEFAULT_TW_STOCKS[:2]
         
-        recommendations = AIAdvisor.get_portfolio_recommendations(all_symbols)
-        return recommendations
+        return all_symbols
     
     @staticmethod
     def check_price_alerts() -> List[Dict]:
@@ -2,17 +2,76 @@
 股票資料服務 - 支援台股與美股
 使用 yfinance (免費 API)
 """
+import time
 import yfinance as yf
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from config import Config
+from services.cache import ttl_cached
+
+try:
+    from yfinance.exceptions import YFRateLimitError
+except ImportError:  # 舊版 yfinance 沒有限流例外，只重試網路錯誤
+    YFRateLimitError = None
+
+
+# 可重試的暫時性錯誤：網路錯誤（requests 與 curl_cffi 的例外皆繼承 OSError）與 Yahoo 限流
+_TRANSIENT_ERRORS = (OSError, YFRateLimitError) if YFRateLimitError else (OSError,)
+
+# get_stock_info 從 fast_info 讀取的欄位（市值需另查股數或完整 info，改由 _get_profile 提供）
+_QUOTE_FIELDS = ('last_price', 'previous_close', 'currency', 'year_high', 'year_low')
+
+
+def _retry(func: Callable[[], Any], tries: int = Config.FETCH_RETRIES,
+           base_delay: float = Config.FETCH_RETRY_BASE_DELAY) -> Any:
+    """
+    呼叫 func，遇到暫時性錯誤時以指數退避重試
+    
+    Args:
+        func: 無參數的抓取函式
+        tries: 最多嘗試次數
+        base_delay: 第一次重試前的等待秒數，之後每次加倍
+    
+    Returns:
+        func 的回傳值；最後一次仍失敗時拋出原例外
+    """
+    for attempt in range(tries):
+        try:
+            return func()
+        except _TRANSIENT_ERRORS:
+            if attempt == tries - 1:
+                raise
+            time.sleep(base_delay * 2 ** attempt)
+
+
+def _read_quote(symbol: str) -> Dict:
+    """讀取 fast_info 報價欄位（屬性存取時才會發出請求）"""
+    quote = yf.Ticker(symbol).fast_info
+    return {field: getattr(quote, field) for field in _QUOTE_FIELDS}
 
 
 class StockService:
     """股票資料服務"""
     
+    # 市場摘要的主要指數（代碼: 顯示名稱）
+    MARKET_INDICES = {
+        '^GSPC': 'S&P 500',
+        '^DJI': 'Dow Jones',
+        '^IXIC': 'NASDAQ',
+        '^TWII': '台灣加權指數',
+    }
+    
+    # 最近一次實際重新計算市場摘要的時間
+    market_summary_updated_at: Optional[datetime] = None
+    
     @staticmethod
+    @ttl_cached(ttl=Config.QUOTE_CACHE_TTL,
+                key=lambda symbol: symbol,
+                should_cache=lambda info: 'error' not in info,
+                disk_ttl=Config.QUOTE_CACHE_TTL)
     def get_stock_info(symbol: str) -> Dict:
         """
         取得股票基本資訊
@@ -24,24 +83,79 @@ class StockService:
             股票資訊字典
         """
         try:
-            stock = yf.Ticker(symbol)
-            info = stock.info
+            # 報價欄位改用輕量的 fast_info，不必抓取完整的 info
+            quote = _retry(lambda: _read_quote(symbol))
+            current_price = quote['last_price']
+            if current_price is None:
+                return {'symbol': symbol, 'error': '查無報價'}
+            
+            profile = StockService._get_profile(symbol)
             return {
                 'symbol': symbol,
+                'name': profile.get('name', symbol),
+                'currency': quote['currency'] or 'USD',
+                'current_price': current_price,
+                'previous_close': quote['previous_close'] or 0,
+                'market_cap': profile.get('market_cap', 0),
+                'pe_ratio': profile.get('pe_ratio', 0),
+                'dividend_yield': profile.get('dividend_yield', 0),
+                'fifty_two_week_high': quote['year_high'] or 0,
+                'fifty_two_week_low': quote['year_low'] or 0,
+            }
+        except Exception as e:
+            return {'symbol': symbol, 'error': str(e)}
+    
+    @staticmethod
+    @ttl_cached(ttl=Config.PROFILE_CACHE_TTL,
+                key=lambda symbol: symbol,
+                should_cache=lambda profile: 'error' not in profile,
+                disk_ttl=Config.PROFILE_CACHE_TTL,
+                negative_ttl=Config.PROFILE_ERROR_CACHE_TTL)
+    def _get_profile(symbol: str) -> Dict:
+        """
+        取得名稱、市值、本益比與殖利率
+        
+        這些欄位需要完整的 info（市值在 fast_info 中也要另查股數），抓取成本高且一天內很少變動，
+        因此單獨長時間快取
+        """
+        try:
+            info = _retry(lambda: yf.Ticker(symbol).info)
+            return {
                 'name': info.get('longName', info.get('shortName', symbol)),
-                'currency': info.get('currency', 'USD'),
-                'current_price': info.get('currentPrice', info.get('regularMarketPrice', 0)),
-                'previous_close': info.get('previousClose', 0),
-                'market_cap': info.get('marketCap', 0),
+                'market_cap': info.get('marketCap') or 0,
                 'pe_ratio': info.get('trailingPE', 0),
                 'dividend_yield': info.get('dividendYield', 0),
-                'fifty_two_week_high': info.get('fiftyTwoWeekHigh', 0),
-                'fifty_two_week_low': info.get('fiftyTwoWeekLow', 0),
             }
         except Exception as e:
             return {'symbol': symbol, 'error': str(e)}
     
     @staticmethod
+    def get_stock_infos(symbols: List[str], refresh: bool = False) -> Dict[str, Dict]:
+        """
+        並行取得多支股票基本資訊
+        
+        Args:
+            symbols: 股票代碼列表
+            refresh: 是否略過快取重新抓取（並更新快取）
+        
+        Returns:
+            以股票代碼為鍵的股票資訊字典
+        """
+        unique_symbols = list(dict.fromkeys(symbols))
+        if not unique_symbols:
+            return {}
+        
+        fetch = StockService.get_stock_info.refresh if refresh else StockService.get_stock_info
+        workers = min(Config.FETCH_MAX_WORKERS, len(unique_symbols))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            infos = executor.map(fetch, unique_symbols)
+        return dict(zip(unique_symbols, infos))
+    
+    @staticmethod
+    @ttl_cached(ttl=Config.HISTORY_CACHE_TTL,
+                key=lambda symbol, period='3mo', interval='1d': f'{symbol}:{period}:{interval}',
+                should_cache=lambda df: not df.empty,
+                disk_ttl=Config.HISTORY_CACHE_TTL)
     def get_historical_data(symbol: str, period: str = '3mo', interval: str = '1d') -> pd.DataFrame:
         """
         取得歷史股價資料
@@ -55,14 +169,51 @@ class StockService:
             歷史資料 DataFrame
         """
         try:
-            stock = yf.Ticker(symbol)
-            df = stock.history(period=period, interval=interval)
+            df = _retry(lambda: yf.Ticker(symbol).history(period=period, interval=interval))
             df.reset_index(inplace=True)
             return df
         except Exception as e:
             print(f"Error fetching data for {symbol}: {e}")
             return pd.DataFrame()
     
+    @staticmethod
+    @ttl_cached(ttl=Config.HISTORY_CACHE_TTL,
+                key=lambda symbols, period='3mo', interval='1d': (tuple(dict.fromkeys(symbols)), period, interval),
+                should_cache=lambda df: not df.empty)
+    def get_close_matrix(symbols: List[str], period: str = '3mo', interval: str = '1d') -> pd.DataFrame:
+        """
+        一次下載多支股票的收盤價
+        
+        Args:
+            symbols: 股票代碼列表
+            period: 期間
+            interval: 間隔
+        
+        Returns:
+            以日期為索引、股票代碼為欄位的收盤價 DataFrame（無報價處為 NaN）
+        """
+        unique_symbols = list(dict.fromkeys(symbols))
+        if not unique_symbols:
+            return pd.DataFrame()
+        
+        try:
+            data = _retry(lambda: yf.download(unique_symbols, period=period, interval=interval,
+                                              group_by='ticker', auto_adjust=True,
+                                              threads=True, progress=False))
+        except Exception as e:
+            print(f"Error downloading data for {unique_symbols}: {e}")
+            return pd.DataFrame()
+        
+        if data.empty:
+            return pd.DataFrame()
+        
+        if isinstance(data.columns, pd.MultiIndex):
+            closes = data.xs('Close', axis=1, level=1)
+        else:
+            # 舊版 yfinance 單一股票時不回傳多層欄位
+            closes = data[['Close']].set_axis(unique_symbols[:1], axis=1)
+        return closes.reindex(columns=unique_symbols)
+    
     @staticmethod
     def get_multiple_stocks_data(symbols: List[str], period: str = '1d') -> Dict[str, Dict]:
         """
@@ -75,14 +226,13 @@ class StockService:
         Returns:
             股票資料字典
         """
-        results = {}
-        for symbol in symbols:
-            info = StockService.get_stock_info(symbol)
-            if 'error' not in info:
-                results[symbol] = info
-        return results
+        infos = StockService.get_stock_infos(symbols)
+        return {symbol: info for symbol, info in infos.items() if 'error' not in info}
     
     @staticmethod
+    @ttl_cached(ttl=Config.QUOTE_CACHE_TTL,
+                key=lambda: 'market_summary',
+                should_cache=lambda summary: not any('error' in v for v in summary.values()))
     def get_market_summary() -> Dict:
         """
         取得市場摘要（主要指數）
@@ -90,32 +240,32 @@ class StockService:
         Returns:
             市場指數資料
         """
-        indices = {
-            '^GSPC': 'S&P 500',
-            '^DJI': 'Dow Jones',
-            '^IXIC': 'NASDAQ',
-            '^TWII': '台灣加權指數',
-        }
+        indices = StockService.MARKET_INDICES
+        
+        # 所有指數一次下載，再依指數切出各自的收盤價陣列（摘要本身已有快取，這裡略過收盤價快取）
+        closes = StockService.get_close_matrix.refresh(list(indices), period='2d')
         
         summary = {}
         for symbol, name in indices.items():
-            try:
-                ticker = yf.Ticker(symbol)
-                hist = ticker.history(period='2d')
-                if len(hist) >= 2:
-                    current = hist['Close'].iloc[-1]
-                    previous = hist['Close'].iloc[-2]
-                    change = current - previous
-                    change_pct = (change / previous) * 100
-                    summary[name] = {
-                        'symbol': symbol,
-                        'price': round(current, 2),
-                        'change': round(change, 2),
-                        'change_pct': round(change_pct, 2),
-                    }
-            except Exception as e:
-                summary[name] = {'symbol': symbol, 'error': str(e)}
+            if closes.empty:
+                summary[name] = {'symbol': symbol, 'error': '無法取得指數資料'}
+                continue
+            
+            close = closes[symbol].to_numpy(dtype=np.float64)
+            close = close[~np.isnan(close)]
+            if len(close) >= 2:
+                current = close[-1]
+                previous = close[-2]
+                change = current - previous
+                change_pct = (change / previous) * 100
+                summary[name] = {
+                    'symbol': symbol,
+                    'price': round(current, 2),
+                    'change': round(change, 2),
+                    'change_pct': round(change_pct, 2),
+                }
         
+        StockService.market_summary_updated_at = datetime.now()
         return summary
 
 